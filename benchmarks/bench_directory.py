@@ -0,0 +1,98 @@
+"""Memory used by the user list, full slack objects vs the compact `Directory`
+
+    $ python benchmarks/bench_directory.py --users 100000 --output directory.json
+"""
+import os
+import sys
+import gc
+import json
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from slackbot_queue.directory import DEFAULT_USER_FIELDS, Directory  # noqa: E402
+
+PAGE_SIZE = 1000
+
+
+def make_member(i):
+    """Roughly the size and shape of a `users.list` member
+    """
+    user_id = 'U{:010d}'.format(i)
+    name = 'user.number{}'.format(i)
+    profile = {'title': 'Software Engineer', 'phone': '', 'skype': '',
+               'real_name': 'User Number {}'.format(i), 'real_name_normalized': 'User Number {}'.format(i),
+               'display_name': name, 'display_name_normalized': name,
+               'fields': None, 'status_text': 'In a meeting', 'status_emoji': ':calendar:', 'status_expiration': 0,
+               'avatar_hash': 'g{:011x}'.format(i), 'email': '{}@example.com'.format(name),
+               'first_name': 'User', 'last_name': 'Number {}'.format(i), 'team': 'T0000000001'}
+    for size in (24, 32, 48, 72, 192, 512):
+        profile['image_{}'.format(size)] = ('https://secure.gravatar.com/avatar/{:032x}.jpg?s={}&d=https%3A%2F%2Fa.'
+                                            'slack-edge.com%2Fdf10d%2Fimg%2Favatars%2Fava_0001-{}.png'
+                                            .format(i, size, size))
+    return {'id': user_id, 'team_id': 'T0000000001', 'name': name, 'deleted': False, 'color': '9f69e7',
+            'real_name': 'User Number {}'.format(i), 'tz': 'America/New_York', 'tz_label': 'Eastern Daylight Time',
+            'tz_offset': -14400, 'profile': profile, 'is_admin': False, 'is_owner': False,
+            'is_primary_owner': False, 'is_restricted': False, 'is_ultra_restricted': False, 'is_bot': False,
+            'is_app_user': False, 'updated': 1600000000 + i, 'is_email_confirmed': True,
+            'who_can_share_contact_card': 'EVERYONE'}
+
+
+def pages(count):
+    for start in range(0, count, PAGE_SIZE):
+        yield [make_member(i) for i in range(start, min(count, start + PAGE_SIZE))]
+
+
+def build_full(count):
+    # How the user list was stored before, the full objects by id & name in one dict
+    users = {}
+    for page in pages(count):
+        by_id = {item['id']: item for item in page}
+        by_name = {item['name']: item for item in page}
+        users.update({**by_id, **by_name})
+    return users
+
+
+def build_compact(count, fields):
+    users = Directory(fields)
+    for page in pages(count):
+        for item in page:
+            users.add(item)
+    return users
+
+
+def measure(build, *args):
+    gc.collect()
+    tracemalloc.start()
+    result = build(*args)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {'current_mb': current / 1024 / 1024, 'peak_mb': peak / 1024 / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the memory used to store the user list')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('-o', '--output', help='Write the results as json to this file')
+    args = parser.parse_args()
+
+    results = {'users': args.users,
+               'full': measure(build_full, args.users),
+               'compact': measure(build_compact, args.users, DEFAULT_USER_FIELDS),
+               'compact_id_name_only': measure(build_compact, args.users, ('id', 'name')),
+               }
+
+    for name in ['full', 'compact', 'compact_id_name_only']:
+        print("{name:<22} {current:>9.1f} MB held  {peak:>9.1f} MB peak"
+              .format(name=name, current=results[name]['current_mb'], peak=results[name]['peak_mb']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Time how long `import slackbot_queue` takes in a fresh interpreter
+
+Also checks that the heavy dependencies are not imported until they are used.
+
+    $ python benchmarks/bench_import.py --output import.json
+    $ python benchmarks/bench_import.py --max-ms 150  # Exits with 1 if slower or a heavy module got imported
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Should only be imported once they are needed
+LAZY_MODULES = ['celery', 'slackclient', 'requests', 'yaml', 'urllib.request', 'http.server',
+                'concurrent.futures']
+
+IMPORTS = {'package': 'import slackbot_queue',
+           'utils': 'import slackbot_queue.utils; slackbot_queue.utils.Utils',
+           }
+
+SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed_ms': elapsed * 1000, 'loaded': [m for m in {lazy} if m in sys.modules]}}))
+"""
+
+
+def time_import(statement, runs):
+    timings = []
+    loaded = set()
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', SCRIPT.format(statement=statement,
+                                                                              lazy=LAZY_MODULES)],
+                                         env=env, cwd=ROOT)
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        timings.append(result['elapsed_ms'])
+        loaded.update(result['loaded'])
+
+    timings.sort()
+    return {'runs': runs,
+            'min_ms': timings[0],
+            'median_ms': timings[len(timings) // 2],
+            'max_ms': timings[-1],
+            'heavy_modules_loaded': sorted(loaded),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time importing slackbot_queue')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, help='Fail if the median import time is more then this')
+    parser.add_argument('-o', '--output', help='Write the results as json to this file')
+    args = parser.parse_args()
+
+    results = {name: time_import(statement, args.runs) for name, statement in IMPORTS.items()}
+
+    failed = False
+    for name, result in results.items():
+        print("{name:<8} median={median:>7.1f}ms  min={min:>7.1f}ms  heavy modules loaded: {loaded}"
+              .format(name=name, median=result['median_ms'], min=result['min_ms'],
+                      loaded=', '.join(result['heavy_modules_loaded']) or 'none'))
+        if result['heavy_modules_loaded']:
+            failed = True
+        if args.max_ms is not None and result['median_ms'] > args.max_ms:
+            failed = True
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""Microbenchmarks for the `Parser` trigger dispatch
+
+Builds parsers with synthetic trigger sets (plain and named groups) and times
+`parse_message`, `parse_reaction` and `parse_file_share` over generated corpora.
+
+    $ python benchmarks/bench_parser.py --output results.json
+    $ python benchmarks/bench_parser.py --output new.json --compare results.json
+
+Results are written as json so runs can be compared against each other.
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import subprocess
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from slackbot_queue.replay import percentile  # noqa: E402
+from slackbot_queue.slack_controller import Parser  # noqa: E402
+
+DEFAULT_SIZES = [10, 100, 1000, 5000]
+PATTERNS_PER_HANDLER = 5  # Each handler gets a few triggers, like a real command class
+
+WORDS = ['the', 'deploy', 'build', 'status', 'please', 'can', 'you', 'check', 'prod', 'staging', 'help', 'ticket',
+         'release', 'thanks', 'rollback', 'server', 'queue', 'latency', 'today', 'meeting', 'report', 'error']
+EMOJIS = ['+1', 'tada', 'eyes', 'white_check_mark', 'grin', 'wave', 'fire', 'rocket', 'ok_hand', 'thinking_face']
+FILETYPES = ['csv', 'png', 'jpg', 'pdf', 'text', 'python', 'gzip', 'json', 'docx', 'xlsx']
+
+
+def _make_handler(index):
+    def handler(*args, **kwargs):
+        return {'text': 'ok'}
+
+    handler.__name__ = 'handler_{}'.format(index)
+    return handler
+
+
+def build_parser(size):
+    """Build a parser with `size` patterns registered on each event type
+
+    Every other pattern uses named groups
+    """
+    parser = Parser()
+    handler = None
+    for i in range(size):
+        if i % PATTERNS_PER_HANDLER == 0:
+            handler = _make_handler(i)
+
+        if i % 2 == 0:
+            parser.trigger('message', '^cmd{i} (\\w+)(?: (\\d+))?$'.format(i=i))(handler)
+            parser.trigger('reaction_added', '^react{i}$'.format(i=i), '(\\w+)')(handler)
+            parser.trigger('file_share', '^type{i}$'.format(i=i), '(.+)\\.(\\w+)$')(handler)
+        else:
+            parser.trigger('message', '^(?P<verb>do{i}) (?P<target>\\S+)'.format(i=i))(handler)
+            parser.trigger('reaction_added', '^(?P<reaction>react{i})$'.format(i=i),
+                           '(?P<first_word>\\w+)')(handler)
+            parser.trigger('file_share', '^(?P<filetype>type{i})$'.format(i=i),
+                           '(?P<name>.+)\\.(?P<ext>\\w+)$')(handler)
+
+    return parser
+
+
+def _random_text(rand, min_words=3, max_words=40):
+    return ' '.join(rand.choice(WORDS) for _ in range(rand.randint(min_words, max_words)))
+
+
+def build_corpora(size, count, match_rate, seed):
+    """Mostly chatter that does not match anything, `match_rate` of the events hit a random trigger
+    """
+    rand = random.Random(seed)
+    messages, reactions, file_shares = [], [], []
+    for _ in range(count):
+        is_match = rand.random() < match_rate
+        i = rand.randrange(size)
+        if is_match:
+            if i % 2 == 0:
+                messages.append('cmd{i} {word} {num}'.format(i=i, word=rand.choice(WORDS), num=rand.randint(1, 99)))
+            else:
+                messages.append('do{i} {text}'.format(i=i, text=_random_text(rand, 1, 10)))
+            reactions.append(('react{i}'.format(i=i), _random_text(rand)))
+            file_shares.append(('type{i}'.format(i=i), 'report_{}.{}'.format(i, rand.choice(FILETYPES))))
+        else:
+            messages.append(_random_text(rand))
+            reactions.append((rand.choice(EMOJIS), _random_text(rand)))
+            file_shares.append((rand.choice(FILETYPES), 'upload_{}.{}'.format(i, rand.choice(FILETYPES))))
+
+    return messages, reactions, file_shares
+
+
+def _time_calls(func, args_list):
+    timings = []
+    perf_counter = time.perf_counter
+    start = perf_counter()
+    for args in args_list:
+        call_start = perf_counter()
+        func(*args, full_event={})
+        timings.append(perf_counter() - call_start)
+    total = perf_counter() - start
+
+    timings.sort()
+    return {'events': len(timings),
+            'total_s': total,
+            'events_per_s': len(timings) / total if total else 0.0,
+            'mean_us': sum(timings) / len(timings) * 1e6,
+            'p50_us': percentile(timings, 50) * 1e6,
+            'p90_us': percentile(timings, 90) * 1e6,
+            'p99_us': percentile(timings, 99) * 1e6,
+            'max_us': timings[-1] * 1e6,
+            }
+
+
+def run(sizes, count, match_rate, seed, repeat):
+    results = []
+    for size in sizes:
+        build_start = time.perf_counter()
+        parser = build_parser(size)
+        build_time = time.perf_counter() - build_start
+
+        messages, reactions, file_shares = build_corpora(size, count, match_rate, seed)
+        corpora = {'parse_message': (parser.parse_message, [(message,) for message in messages]),
+                   'parse_reaction': (parser.parse_reaction, reactions),
+                   'parse_file_share': (parser.parse_file_share, file_shares),
+                   }
+
+        for name, (func, args_list) in corpora.items():
+            # Keep the best run, the others are most likely noise from the machine
+            best = None
+            for _ in range(repeat):
+                result = _time_calls(func, args_list)
+                if best is None or result['events_per_s'] > best['events_per_s']:
+                    best = result
+
+            best.update({'benchmark': name, 'patterns': size, 'build_s': build_time})
+            results.append(best)
+            print("{name:<18} patterns={size:<6} {eps:>12,.0f} ev/s  p50={p50:>9.1f}us  p99={p99:>9.1f}us"
+                  .format(name=name, size=size, eps=best['events_per_s'], p50=best['p50_us'], p99=best['p99_us']))
+
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(results, previous_path, threshold):
+    """Print the change in throughput and p99 from a previous run
+
+    Returns:
+        bool: True if any benchmark regressed more then `threshold` percent
+
+    """
+    with open(previous_path, 'r') as f:
+        previous = {(item['benchmark'], item['patterns']): item for item in json.load(f)['results']}
+
+    regressed = False
+    for result in results:
+        old = previous.get((result['benchmark'], result['patterns']))
+        if old is None:
+            continue
+
+        throughput_change = (result['events_per_s'] - old['events_per_s']) / old['events_per_s'] * 100
+        p99_change = (result['p99_us'] - old['p99_us']) / old['p99_us'] * 100 if old['p99_us'] else 0.0
+        flag = ''
+        if throughput_change < -threshold or p99_change > threshold:
+            flag = '  <-- regression'
+            regressed = True
+
+        print("{name:<18} patterns={size:<6} throughput {tp:+7.1f}%  p99 {p99:+7.1f}%{flag}"
+              .format(name=result['benchmark'], size=result['patterns'], tp=throughput_change, p99=p99_change,
+                      flag=flag))
+
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Parser trigger dispatch')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='Comma separated number of patterns to register')
+    parser.add_argument('--events', type=int, default=2000, help='Number of events in each corpus')
+    parser.add_argument('--match-rate', type=float, default=0.2, help='Fraction of events that match a trigger')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark, the best one is kept')
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('-o', '--output', help='Write the results as json to this file')
+    parser.add_argument('--compare', help='json results from a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Percent change that counts as a regression when comparing')
+    args = parser.parse_args()
+
+    # Registering thousands of triggers logs a line each
+    logging.getLogger('slackbot_queue').setLevel(logging.WARNING)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = run(sizes, args.events, args.match_rate, args.seed, args.repeat)
+
+    if args.output:
+        data = {'meta': {'time': time.time(),
+                         'git_revision': _git_revision(),
+                         'python': platform.python_version(),
+                         'platform': platform.platform(),
+                         'events': args.events,
+                         'match_rate': args.match_rate,
+                         'seed': args.seed,
+                         },
+                'results': results,
+                }
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=2)
+
+    if args.compare:
+        if compare(results, args.compare, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,8 @@ logger = logging.getLogger(__name__)
 
 parser = argparse.ArgumentParser(description='Slackbot with task queue')
 parser.add_argument('-w', '--worker', action='store_true', help='If set, this will run as a worker')
+parser.add_argument('-e', '--events', action='store_true',
+                    help='If set, listen for the Events API over http instead of using RTM')
 args = parser.parse_args()
 
 
@@ -83,7 +85,10 @@ slack_controller.add_commands(commands)
 
 
 if __name__ == '__main__':
-    if args.worker is False:
+    if args.worker is False and args.events is True:
+        # The signing secret is set by the env var `SLACK_SIGNING_SECRET`
+        slack_controller.start_events_listener(port=3000)
+    elif args.worker is False:
         slack_controller.start_listener()
     else:
         slack_controller.start_worker(argv=['celery', 'worker', '--concurrency', '1', '-l', 'info'])
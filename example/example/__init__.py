@@ -14,6 +14,9 @@ class Example:
 
         self.long_task = self.parser.trigger('message', 'task (.+)')(self.long_task)
         self.reaction = self.parser.trigger('reaction_added', '(.*)', '.*')(self.reaction)
+        self.remind_me = self.parser.trigger('message', r'remind me in (\d+) minutes? to (.+)')(self.remind_me)
+        # Called by the worker when the timer from `remind_me` is due
+        self.reminder = self.parser.trigger('scheduled', '^reminder$')(self.reminder)
 
     def long_task(self, matched_str, value, full_event={}):
         """ Add a task to the queue and return a message letting the user know
@@ -32,6 +35,21 @@ class Example:
 
         return message_data
 
+    def remind_me(self, matched_str, minutes, text, full_event={}):
+        """ Schedule a reminder, nothing waits on it so it does not use up a worker
+        """
+        self.slack.schedule('reminder',
+                            delay=int(minutes) * 60,
+                            channel=full_event['channel']['id'],
+                            user=full_event['user']['id'],
+                            data={'text': text},
+                            )
+        return {'text': "I will remind you in {minutes} minutes".format(minutes=minutes)}
+
+    def reminder(self, name_str, full_event={}):
+        user = '<@{user_id}>'.format(user_id=full_event['user']['id'])
+        return {'text': "{user}: Reminder to {text}".format(user=user, text=full_event['scheduled']['data']['text'])}
+
     def reaction(self, reaction_str, message_str, reaction_value, full_event={}):
         """ Any time a user adds a reaction, the bot will add the thumbsup reaction to the same message/file
         """
@@ -51,6 +69,7 @@ class Example:
         """ This is called when the user types `help` or `@botname help`
         """
         text = ('- task <task name>\n'
+                '- remind me in <minutes> minutes to <something>\n'
                 '- Add a reaction, and the bot will react with the same thing\n'
                 )
         message_data = {'attachments': [{'title': "Example Commands",
@@ -65,25 +65,24 @@ class Example2:
     def multi_action(self, matched_str, full_event={}):
         """ Add multiple reactions and post a message
         """
-
-        # Add the first reaction
-        message_data = {'method': 'reactions.add',
-                        'name': 'wave',
-                        'channel': full_event['channel']['id'],
-                        'timestamp': full_event['message']['ts'],
-                        }
-        self.slack.slack_client.api_call(**message_data)
-
-        # Add another reaction (could be anything though)
-        message_data = {'method': 'reactions.add',
-                        'name': '+1',
-                        'channel': full_event['channel']['id'],
-                        'timestamp': full_event['message']['ts'],
-                        }
-        self.slack.slack_client.api_call(**message_data)
-
-        # And reply with a message, otherwise return `{}` if you do not want any other function to get triggered
-        return {'text': "Yeah, thats right. I just did that."}
+        # Yield a list of actions to send them all at once, the results from slack are sent back
+        # Reactions are added at the same time, other methods are run one after another in the order listed
+        reaction_results = yield [{'method': 'reactions.add',
+                                   'name': 'wave',
+                                   'timestamp': full_event['message']['ts'],
+                                   },
+                                  {'method': 'reactions.add',
+                                   'name': '+1',
+                                   'timestamp': full_event['message']['ts'],
+                                   },
+                                  ]
+
+        # Yield a single action to get just its result back
+        post_result = yield {'text': "Yeah, thats right. I just did that."}
+
+        if all(result.get('ok') for result in reaction_results) and post_result.get('ok'):
+            # Reply in a thread on the message that was just posted
+            yield {'text': "Both reactions were added", 'thread_ts': post_result['ts']}
 
     def file_reply(self, type_str, name_str, full_event={}):
         """ Add a comment to a file
@@ -0,0 +1,116 @@
+"""Send more then one action from a single handler
+
+A handler can return (or yield) a list of actions instead of a single dict, each action is the same as the
+dict a handler would normally return. A list is sent as one batch and the actions in it are run at the same
+time where the order does not matter (see `UNORDERED_METHODS`), the rest are run one after another in the
+order they are listed.
+
+When the handler is a generator, the results from slack are sent back in to it::
+
+    def multi_action(self, matched_str, full_event={}):
+        reaction_results = yield [{'method': 'reactions.add', 'name': 'wave', 'timestamp': ...},
+                                  {'method': 'reactions.add', 'name': '+1', 'timestamp': ...}]
+        post_result = yield {'text': 'Done'}
+        yield {'text': 'In a thread', 'thread_ts': post_result['ts']}
+"""
+import logging
+import threading
+import types
+
+logger = logging.getLogger(__name__)
+
+# Methods where it does not matter what order they are run in
+UNORDERED_METHODS = {'reactions.add', 'reactions.remove', 'pins.add', 'pins.remove', 'stars.add', 'stars.remove'}
+
+MAX_WORKERS = 8  # Threads in each pool, the pools are shared by every controller
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(name='actions'):
+    """Shared thread pool, separate pools are used for work that waits on other pools so they can not deadlock
+    """
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                executor = ThreadPoolExecutor(max_workers=MAX_WORKERS,
+                                              thread_name_prefix='slackbot-{name}'.format(name=name))
+                _executors[name] = executor
+    return executor
+
+
+def is_multi_action(parsed_response):
+    return isinstance(parsed_response, (list, tuple, types.GeneratorType))
+
+
+def run_actions(slack_client, parsed_response, defaults):
+    """Send all the actions from a handler
+
+    Args:
+        slack_client (SlackClient): Used to make the api calls
+        parsed_response (list/generator): What the handler returned
+        defaults (dict): Added to each action unless the action has its own value (`channel`, `method`, ...)
+
+    Returns:
+        list: The results of every action that was sent, in order
+
+    """
+    if not isinstance(parsed_response, types.GeneratorType):
+        return run_batch(slack_client, parsed_response, defaults)
+
+    all_results = []
+    generator = parsed_response
+    try:
+        actions = next(generator)
+        while True:
+            if isinstance(actions, dict):
+                result = run_batch(slack_client, [actions], defaults)[0]
+                all_results.append(result)
+            elif actions is None:
+                result = None
+            else:
+                result = run_batch(slack_client, actions, defaults)
+                all_results.extend(result)
+            actions = generator.send(result)
+    except StopIteration:
+        pass
+
+    return all_results
+
+
+def run_batch(slack_client, actions, defaults):
+    """Send a list of actions, the unordered ones are all sent at once
+    """
+    actions = [dict(defaults, **action) for action in actions]
+    if len(actions) == 1:
+        return [_call(slack_client, actions[0])]
+
+    executor = get_executor()
+    ordered = [i for i, action in enumerate(actions) if action.get('method') not in UNORDERED_METHODS]
+    futures = {i: executor.submit(_call, slack_client, action)
+               for i, action in enumerate(actions) if action.get('method') in UNORDERED_METHODS}
+
+    results = [None] * len(actions)
+    # The ordered actions go one after another on this thread while the unordered ones run
+    for i in ordered:
+        results[i] = _call(slack_client, actions[i])
+
+    for i, future in futures.items():
+        results[i] = future.result()
+
+    return results
+
+
+def _call(slack_client, action):
+    try:
+        result = slack_client.api_call(**action)
+    except Exception as e:
+        logger.exception("Failed to send action: {action}".format(action=action))
+        return {'ok': False, 'error': str(e)}
+
+    logger.debug("Slack api response: {response}".format(response=result))
+    return result
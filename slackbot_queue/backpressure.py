@@ -0,0 +1,185 @@
+import time
+import logging
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+# What to do with an event when the inbound buffer is full
+DROP_OLDEST = 'drop_oldest'  # Drop the oldest buffered event
+DROP_BY_CHANNEL = 'drop_by_channel'  # Drop the oldest buffered event from the channel with the most buffered events
+DEFER_TO_QUEUE = 'defer_to_queue'  # Send the oldest buffered event to the worker queue to be handled there
+OVERFLOW_POLICIES = [DROP_OLDEST, DROP_BY_CHANNEL, DEFER_TO_QUEUE]
+
+
+class TokenBucketLimiter:
+    """A token bucket per key (user or channel id)
+
+    Each key can have `burst` events at once and then `rate` events per second after that.
+
+    Args:
+        rate (float): Tokens added per second
+        burst (int): Max tokens a bucket can hold
+        max_keys (int): Once there are more buckets then this, the ones that have filled back up are removed
+
+    """
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = {}  # key: [tokens, last_update]
+
+    def allow(self, key, now=None):
+        if now is None:
+            now = time.monotonic()
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune(now)
+            bucket = self._buckets[key] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True
+
+        return False
+
+    def _prune(self, now):
+        # A full bucket is the same as not having one, so they are safe to remove
+        for key, (tokens, last_update) in list(self._buckets.items()):
+            if tokens + (now - last_update) * self.rate >= self.burst:
+                del self._buckets[key]
+
+
+class InboundBuffer:
+    """Bounded buffer in front of the event handlers
+
+    Events are checked against the per user and per channel limits as they come in, before any
+    directory lookups or regex matching is done. Anything that is not handled is counted in `shed`.
+
+    Args:
+        max_size (int): Most events that can be waiting to be handled
+        overflow_policy (str): One of `OVERFLOW_POLICIES`
+        user_rate (float): Events per second per user, `None` for no limit
+        user_burst (int): Events a user can send at once before `user_rate` applies
+        channel_rate (float): Events per second per channel, `None` for no limit
+        channel_burst (int): Events a channel can have at once before `channel_rate` applies
+        defer (callable): Passed the event when it is deferred to the queue
+        log_interval (float): Seconds between the warnings logged while events are being shed
+
+    """
+
+    def __init__(self, max_size=1000, overflow_policy=DROP_OLDEST, user_rate=None, user_burst=10,
+                 channel_rate=None, channel_burst=50, defer=None, log_interval=60):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError("Invalid overflow_policy `{policy}`, must be one of {policies}"
+                             .format(policy=overflow_policy, policies=OVERFLOW_POLICIES))
+
+        if overflow_policy == DEFER_TO_QUEUE and defer is None:
+            raise ValueError("A `defer` function is needed for the `{}` overflow_policy".format(DEFER_TO_QUEUE))
+
+        self.max_size = max_size
+        self.overflow_policy = overflow_policy
+        self.defer = defer
+        self.log_interval = log_interval
+
+        self.user_limiter = TokenBucketLimiter(user_rate, user_burst) if user_rate is not None else None
+        self.channel_limiter = TokenBucketLimiter(channel_rate, channel_burst) if channel_rate is not None else None
+
+        self.shed = Counter()  # Keyed by the reason the event was not handled
+        self._buffer = deque()
+        self._channel_counts = Counter()
+        self._last_log = 0
+        self._shed_since_log = 0
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def put(self, event):
+        """Add the event to the buffer
+
+        Returns:
+            bool: False if the event was shed because of a rate limit
+
+        """
+        now = time.monotonic()
+        user = event.get('user')
+        channel = _get_event_channel(event)
+
+        if self.user_limiter is not None and user is not None and not self.user_limiter.allow(user, now):
+            self._count_shed('user_rate_limited')
+            return False
+
+        if (self.channel_limiter is not None and channel is not None
+                and not self.channel_limiter.allow(channel, now)):
+            self._count_shed('channel_rate_limited')
+            return False
+
+        if len(self._buffer) >= self.max_size:
+            self._overflow()
+
+        self._buffer.append((channel, event))
+        self._channel_counts[channel] += 1
+        return True
+
+    def get(self):
+        """Next event to handle, `None` if the buffer is empty
+        """
+        if not self._buffer:
+            return None
+
+        channel, event = self._buffer.popleft()
+        self._remove_channel_count(channel)
+        return event
+
+    def _overflow(self):
+        if self.overflow_policy == DROP_BY_CHANNEL:
+            busiest_channel = self._channel_counts.most_common(1)[0][0]
+            for i, (channel, event) in enumerate(self._buffer):
+                if channel == busiest_channel:
+                    del self._buffer[i]
+                    break
+            self._remove_channel_count(busiest_channel)
+            self._count_shed('dropped_by_channel')
+            return
+
+        channel, event = self._buffer.popleft()
+        self._remove_channel_count(channel)
+
+        if self.overflow_policy == DEFER_TO_QUEUE:
+            try:
+                self.defer(event)
+            except Exception:
+                logger.exception("Failed to defer event to the queue: {event}".format(event=event))
+                self._count_shed('defer_failed')
+            else:
+                self._count_shed('deferred')
+        else:
+            self._count_shed('dropped_oldest')
+
+    def _remove_channel_count(self, channel):
+        self._channel_counts[channel] -= 1
+        if self._channel_counts[channel] <= 0:
+            del self._channel_counts[channel]
+
+    def _count_shed(self, reason):
+        self.shed[reason] += 1
+        self._shed_since_log += 1
+
+        now = time.monotonic()
+        if now - self._last_log >= self.log_interval:
+            logger.warning("Inbound overloaded, {count} events not handled directly since the last warning."
+                           " Totals: {totals}".format(count=self._shed_since_log, totals=dict(self.shed)))
+            self._last_log = now
+            self._shed_since_log = 0
+
+
+def _get_event_channel(event):
+    channel = event.get('channel')
+    if channel is None:
+        channel = event.get('item', {}).get('channel')
+    return channel
@@ -0,0 +1,68 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class EventDeduplicator:
+    """Remembers the events seen recently so repeats (e.g. after an RTM reconnect) can be skipped
+
+    Args:
+        window (float): Seconds an event is remembered for
+        max_size (int): Most events remembered at once, the oldest are forgotten first
+
+    """
+
+    def __init__(self, window=300, max_size=10000):
+        self.window = window
+        self.max_size = max_size
+        self.duplicates = 0  # How many events have been skipped
+
+        self._seen = OrderedDict()  # key: time first seen, oldest first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._seen)
+
+    def is_duplicate(self, event):
+        """Check the event and remember it if it is new
+
+        Events without a timestamp can not be told apart so they are never counted as duplicates
+        """
+        key = get_event_key(event)
+        if key is None:
+            return False
+
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+
+            if key in self._seen:
+                self.duplicates += 1
+                logger.debug("Skipping duplicate event: {key}".format(key=key))
+                return True
+
+            self._seen[key] = now
+            return False
+
+    def _expire(self, now):
+        oldest_allowed = now - self.window
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if seen_at >= oldest_allowed and len(self._seen) < self.max_size:
+                break
+            self._seen.popitem(last=False)
+
+
+def get_event_key(event):
+    ts = event.get('ts') or event.get('event_ts')
+    if ts is None:
+        return None
+
+    channel = event.get('channel')
+    if channel is None:
+        channel = event.get('item', {}).get('channel')
+
+    return (channel, ts, event.get('type'), event.get('client_msg_id'))
@@ -0,0 +1,95 @@
+"""Compact storage for the user & channel lists
+
+When given a list of fields, only those are kept from each slack object (`DEFAULT_USER_FIELDS` and
+`DEFAULT_CHANNEL_FIELDS` are a good start), stored in a tuple instead of the full dict slack returns.
+Fields in nested objects use a `.`, e.g. `profile.email`. `id` and `name` are always kept.
+"""
+from collections import namedtuple
+
+DEFAULT_USER_FIELDS = ('id', 'name', 'real_name', 'deleted', 'is_bot', 'is_admin', 'tz', 'team_id',
+                       'profile.display_name', 'profile.real_name', 'profile.email')
+DEFAULT_CHANNEL_FIELDS = ('id', 'name', 'is_channel', 'is_group', 'is_private', 'is_archived', 'is_general',
+                          'is_member')
+# Used by the controller for every event
+REQUIRED_FIELDS = ('id', 'name')
+
+_MISSING = object()
+
+
+class Directory:
+    """Users or channels, looked up by id or name
+
+    Args:
+        fields (tuple): The fields to keep from each object, `None` to keep the whole object.
+            `id` and `name` are added if they are missing
+
+    """
+
+    def __init__(self, fields):
+        if fields is not None:
+            fields = tuple(field for field in REQUIRED_FIELDS if field not in fields) + tuple(fields)
+        self.fields = fields
+        self._paths = [field.split('.') for field in self.fields] if self.fields is not None else None
+        if self.fields is not None:
+            self._record_type = namedtuple('Record', [field.replace('.', '__') for field in self.fields],
+                                           rename=True)
+
+        self.by_id = {}
+        self.by_name = {}
+
+    def add(self, item):
+        if 'id' not in item:
+            return
+
+        record = item if self.fields is None else self._record_type(*(_get_path(item, path)
+                                                                      for path in self._paths))
+        self.by_id[item['id']] = record
+        if 'name' in item:
+            self.by_name[item['name']] = record
+
+    def get_record(self, key):
+        record = self.by_id.get(key)
+        if record is None:
+            record = self.by_name.get(key)
+        return record
+
+    def to_dict(self, record):
+        if self.fields is None:
+            return record
+
+        data = {}
+        for path, value in zip(self._paths, record):
+            if value is _MISSING:
+                continue
+            nested = data
+            for key in path[:-1]:
+                nested = nested.setdefault(key, {})
+            nested[path[-1]] = value
+        return data
+
+    def get(self, key, default=None):
+        record = self.get_record(key)
+        if record is None:
+            return default
+        return self.to_dict(record)
+
+    def __getitem__(self, key):
+        record = self.get_record(key)
+        if record is None:
+            raise KeyError(key)
+        return self.to_dict(record)
+
+    def __contains__(self, key):
+        return key in self.by_id or key in self.by_name
+
+    def __len__(self):
+        return len(self.by_id)
+
+
+def _get_path(item, path):
+    value = item
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return _MISSING
+        value = value[key]
+    return value
@@ -0,0 +1,220 @@
+"""Receive events from the Slack Events API over http instead of RTM
+
+Unlike RTM, many of these can be run behind a load balancer since slack sends each event to only one of them.
+
+    slack_controller.setup()
+    slack_controller.add_commands(...)
+    slack_controller.start_events_listener(port=3000)  # Signing secret from the env var `SLACK_SIGNING_SECRET`
+
+Set the Request URL in the slack app settings to `http(s)://<host>/slack/events`
+"""
+import hmac
+import json
+import time
+import queue
+import hashlib
+import logging
+import threading
+from socketserver import ThreadingMixIn
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+logger = logging.getLogger(__name__)
+
+MAX_REQUEST_AGE = 60 * 5  # Seconds, older requests are rejected so they can not be replayed
+MAX_BODY_SIZE = 1024 * 1024  # Bytes, slack events are much smaller. Read before the signature can be checked
+
+
+def sign_request(signing_secret, timestamp, body):
+    """Get the `X-Slack-Signature` header value for a request
+
+    Args:
+        signing_secret (str): From the slack app settings
+        timestamp (str): Value of the `X-Slack-Request-Timestamp` header
+        body (bytes): Raw request body
+
+    """
+    base_string = b'v0:' + str(timestamp).encode('utf-8') + b':' + body
+    return 'v0=' + hmac.new(signing_secret.encode('utf-8'), base_string, hashlib.sha256).hexdigest()
+
+
+def verify_request(signing_secret, timestamp, signature, body, now=None):
+    if not timestamp or not signature:
+        return False
+
+    try:
+        timestamp_value = int(timestamp)
+    except ValueError:
+        return False
+
+    if now is None:
+        now = time.time()
+    if abs(now - timestamp_value) > MAX_REQUEST_AGE:
+        return False
+
+    return hmac.compare_digest(sign_request(signing_secret, timestamp, body), signature)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    # `http.server.ThreadingHTTPServer` is only in python 3.7+
+    daemon_threads = True
+
+
+class EventsApiServer:
+    """Http server for the Events API
+
+    Requests are checked and answered right away, the events are handled after on a separate thread
+    using the same `parse_event` pipeline as the RTM listener.
+    Everything that arrived while the last batch was being handled is passed to `parse_event` together,
+    so the controllers inbound limits (see `SlackController.set_inbound_limits`) apply to that batch.
+
+    Args:
+        controller (SlackController): Already set up with its commands added
+        signing_secret (str): From the slack app settings, used to check every request
+        host (str): Address to listen on
+        port (int): Port to listen on, `0` picks a free one (see `.port`)
+        path (str): Url path slack posts the events to
+        max_pending (int): Events waiting to be handled before new ones are answered with a `503`
+        max_batch (int): Most events passed to `parse_event` at once
+
+    """
+
+    def __init__(self, controller, signing_secret, host='0.0.0.0', port=3000, path='/slack/events',
+                 max_pending=1000, max_batch=500):
+        if not signing_secret:
+            raise ValueError("Missing SLACK_SIGNING_SECRET")
+
+        self.controller = controller
+        self.signing_secret = signing_secret
+        self.path = path
+        self.max_batch = max_batch
+
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._threads = []
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        """Start serving in background threads, use `serve_forever()` to block instead
+        """
+        for target, name in [(self._handle_events, 'slack-events-handler'),
+                             (self._server.serve_forever, 'slack-events-server')]:
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def serve_forever(self):
+        threading.Thread(target=self._handle_events, name='slack-events-handler', daemon=True).start()
+        logger.info("Listening for slack events on port {port}".format(port=self.port))
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._pending.put(None)
+
+    def wait_until_handled(self):
+        """Block until every event received so far has been handled
+        """
+        self._pending.join()
+
+    def _handle_events(self):
+        # Only one thread calls `parse_event` so events are handled in order, the same as RTM
+        while True:
+            batch = [self._pending.get()]
+            while batch[-1] is not None and len(batch) < self.max_batch:
+                try:
+                    batch.append(self._pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopped = batch[-1] is None
+            events = batch[:-1] if stopped else batch
+            try:
+                if events:
+                    self.controller.parse_event(events)
+            except Exception:
+                logger.exception("Failed to handle {count} events".format(count=len(events)))
+            finally:
+                for _ in batch:
+                    self._pending.task_done()
+
+            if stopped:
+                return
+
+    def handle_request(self, headers, body):
+        """
+        Returns:
+            tuple: (http status, response body dict or None)
+
+        """
+        if not verify_request(self.signing_secret,
+                              headers.get('X-Slack-Request-Timestamp'),
+                              headers.get('X-Slack-Signature'),
+                              body):
+            logger.warning("Rejected events request with an invalid signature")
+            return 401, None
+
+        try:
+            data = json.loads(body.decode('utf-8'))
+        except ValueError:
+            return 400, None
+
+        if data.get('type') == 'url_verification':
+            return 200, {'challenge': data.get('challenge')}
+
+        if data.get('type') == 'event_callback' and isinstance(data.get('event'), dict):
+            event = data['event']
+            if data.get('team_id') is not None:
+                # Used to find the workspace when running more then one, see `slackbot_queue.multi_workspace`
+                event.setdefault('team', data['team_id'])
+            try:
+                self._pending.put_nowait(event)
+            except queue.Full:
+                # Let slack retry it later rather then holding the request open
+                logger.warning("Too many events waiting to be handled, rejecting {event_id}"
+                               .format(event_id=data.get('event_id')))
+                return 503, None
+
+        return 200, None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):  # noqa: N802
+                if self.path.split('?', 1)[0] != server.path:
+                    self._respond(404, None)
+                    return
+
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                except ValueError:
+                    length = -1
+
+                if length < 0 or length > MAX_BODY_SIZE:
+                    # The body is not read, so the connection can not be reused
+                    self.close_connection = True
+                    self._respond(400 if length < 0 else 413, None)
+                    return
+
+                status, data = server.handle_request(self.headers, self.rfile.read(length))
+                self._respond(status, data)
+
+            def _respond(self, status, data):
+                response = json.dumps(data).encode('utf-8') if data is not None else b''
+                self.send_response(status)
+                if data is not None:
+                    self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
@@ -0,0 +1,230 @@
+"""Run the bot in many workspaces from one process
+
+    from slackbot_queue.multi_workspace import MultiWorkspaceController
+
+    workspaces = MultiWorkspaceController()
+    for token in tokens:
+        workspaces.add_workspace(slack_bot_token=token)
+
+    # Commands are only created once and are shared by every workspace
+    example = Example(workspaces)
+    workspaces.add_commands({'__all__': [example]})
+
+    workspaces.start_listener()
+
+Each workspace gets its own slack client and user/channel lists, everything else (the commands and their
+`Parser`s, the help function, the duplicate event check) is shared.
+While an event is being handled, `slack_client`, `BOT_ID`, `BOT_NAME`, `users`, etc. are the ones for the
+workspace the event came from.
+"""
+import re
+import time
+import logging
+from collections import defaultdict
+
+from slackbot_queue.dedup import EventDeduplicator
+from slackbot_queue.profiling import handler_profiler
+from slackbot_queue.scheduler import Scheduler
+from slackbot_queue.slack_controller import Parser, SlackController, get_active_controller, workspace_controllers
+
+logger = logging.getLogger(__name__)
+
+
+class MultiWorkspaceController:
+
+    def __init__(self):
+        self.Parser = Parser
+        self.profiler = handler_profiler
+        self.channel_to_actions = defaultdict(list)  # Filled in by the user, shared by every workspace
+        self.seen_events = EventDeduplicator()
+        self.scheduler = Scheduler(fire=self._fire_scheduled)  # One timer thread for every workspace
+        self.workspaces = {}  # Keyed by team id
+        self._run_scheduler = True
+
+        # Same as `SlackController.help_message_regex`, when None each workspace uses its own default
+        self.help_message_regex = None
+
+    def add_workspace(self, slack_bot_token=None, slack_client=None):
+        """Connect to another workspace
+
+        Should be called before the commands are created so `BOT_NAME` includes this workspaces bot
+
+        Returns:
+            SlackController: The controller for just this workspace
+
+        """
+        workspace = SlackController()
+        # Share the commands & their parsers instead of each workspace having its own
+        workspace.channel_to_actions = self.channel_to_actions
+        workspace.seen_events = self.seen_events
+        workspace.scheduler = self.scheduler
+        workspace.run_scheduler = self.run_scheduler
+        workspace.help_message_regex = self.help_message_regex
+        workspace.help = self._help
+        workspace.setup(slack_bot_token=slack_bot_token, slack_client=slack_client)
+
+        self.workspaces[workspace.TEAM_ID] = workspace
+        # So the worker knows which workspace to use for the events it gets
+        workspace_controllers[workspace.TEAM_ID] = workspace
+        logger.info("Added workspace {team_id}".format(team_id=workspace.TEAM_ID))
+        return workspace
+
+    def add_commands(self, channel_commands):
+        for channel, commands in channel_commands.items():
+            for command in commands:
+                self.channel_to_actions[channel].append(command)
+
+    def set_inbound_limits(self, **kwargs):
+        # The inbound buffer is per workspace so one busy workspace can not starve the others
+        for workspace in self.workspaces.values():
+            workspace.set_inbound_limits(**kwargs)
+
+    def help(self, commands, slack_client, full_event={}):
+        """Default help response, can be overridden the same way as `SlackController.help`
+        """
+        return SlackController.help(self, commands, slack_client, full_event=full_event)
+
+    def _help(self, commands, slack_client, full_event={}):
+        # Look up `help` when its called so it can be overridden after the workspaces are added
+        return self.help(commands, slack_client, full_event=full_event)
+
+    @property
+    def run_scheduler(self):
+        """Same as `SlackController.run_scheduler`, for every workspace
+        """
+        return self._run_scheduler
+
+    @run_scheduler.setter
+    def run_scheduler(self, value):
+        self._run_scheduler = value
+        for workspace in self.workspaces.values():
+            workspace.run_scheduler = value
+
+    @property
+    def current(self):
+        """The workspace controller handling the event on this thread
+        """
+        controller = get_active_controller()
+        if controller is None or controller.TEAM_ID not in self.workspaces:
+            raise RuntimeError("Not handling an event from any workspace")
+        return controller
+
+    @property
+    def slack_client(self):
+        return self.current.slack_client
+
+    @property
+    def SLACK_BOT_TOKEN(self):  # noqa: N802
+        return self.current.SLACK_BOT_TOKEN
+
+    @property
+    def BOT_ID(self):  # noqa: N802
+        return self.current.BOT_ID
+
+    @property
+    def TEAM_ID(self):  # noqa: N802
+        return self.current.TEAM_ID
+
+    @property
+    def BOT_NAME(self):  # noqa: N802
+        controller = get_active_controller()
+        if controller is not None and controller.TEAM_ID in self.workspaces:
+            return controller.BOT_NAME
+
+        # Not handling an event (e.g. setting up the triggers), so match the bot in any workspace
+        bot_ids = sorted(workspace.BOT_ID for workspace in self.workspaces.values())
+        return '<@(?:{bot_ids})>'.format(bot_ids='|'.join(re.escape(bot_id) for bot_id in bot_ids))
+
+    @property
+    def channels(self):
+        return self.current.channels
+
+    @property
+    def users(self):
+        return self.current.users
+
+    @property
+    def ims(self):
+        return self.current.ims
+
+    def download(self, url, file_):
+        return self.current.download(url, file_)
+
+    def schedule(self, name, team_id=None, **kwargs):
+        """Same as `SlackController.schedule`, for the workspace `team_id` or the one handling the current event
+
+        When neither is set (e.g. while the commands are being created) it is scheduled in every workspace
+
+        Returns:
+            int/list/None: The timer id, or a list of them when scheduled in every workspace
+
+        """
+        if team_id is not None:
+            return self.workspaces[team_id].schedule(name, **kwargs)
+
+        controller = get_active_controller()
+        if controller is not None and controller.TEAM_ID in self.workspaces:
+            return controller.schedule(name, **kwargs)
+
+        return [workspace.schedule(name, **kwargs) for workspace in self.workspaces.values()]
+
+    def cancel_scheduled(self, timer_id):
+        return self.scheduler.cancel(timer_id)
+
+    def _fire_scheduled(self, payload):
+        SlackController._fire_scheduled(self, payload)
+
+    def start_worker(self, argv=[]):
+        for workspace in self.workspaces.values():
+            workspace._is_worker_process = True
+        SlackController.start_worker(self, argv=argv)
+
+    def start_listener(self):
+        """Listen to every workspace over RTM from this one thread
+        """
+        RTM_READ_DELAY = 1  # noqa, 1 second delay between reading from RTM
+
+        connected = []
+        for team_id, workspace in self.workspaces.items():
+            if workspace.slack_client.rtm_connect(with_team_state=False):
+                connected.append(workspace)
+            else:
+                logger.error("Connection failed for workspace {team_id}".format(team_id=team_id))
+
+        if not connected:
+            logger.error("Could not connect to any workspace")
+            return
+
+        logger.info("Connected to {count} workspaces and running!".format(count=len(connected)))
+        if self.run_scheduler:
+            self.scheduler.start()
+        while True:
+            for workspace in connected:
+                try:
+                    workspace.parse_event(workspace.slack_client.rtm_read())
+                except Exception:
+                    logger.exception("Failed to read events from workspace {team_id}"
+                                     .format(team_id=workspace.TEAM_ID))
+            time.sleep(RTM_READ_DELAY)
+
+    def start_events_listener(self, signing_secret=None, host='0.0.0.0', port=3000, path='/slack/events',
+                              max_pending=1000):
+        """Listen for events from every workspace over the Events API, see `SlackController.start_events_listener`
+        """
+        SlackController.start_events_listener(self, signing_secret=signing_secret, host=host, port=port, path=path,
+                                              max_pending=max_pending)
+
+    def parse_event(self, slack_events):
+        """Send each event to the workspace it came from, using the `team` key on the event
+        """
+        by_team = defaultdict(list)
+        for event in slack_events:
+            by_team[event.get('team')].append(event)
+
+        for team_id, events in by_team.items():
+            workspace = self.workspaces.get(team_id)
+            if workspace is None:
+                logger.warning("Got {count} events for unknown workspace {team_id}"
+                               .format(count=len(events), team_id=team_id))
+                continue
+            workspace.parse_event(events)
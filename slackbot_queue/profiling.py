@@ -0,0 +1,235 @@
+import sys
+import time
+import signal
+import logging
+import threading
+import traceback
+from contextlib import contextmanager
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class HandlerProfiler:
+    """Times every handler call made by a `Parser` and reports the slow ones
+
+    A single watchdog thread checks the in flight calls, once a call has been running longer then
+    `slow_handler_threshold` seconds a warning is logged with the current stack of the thread running it.
+    That way the log shows where the handler is stuck, not just that it was slow.
+
+    The sampling profiler can be turned on and off while the bot is running (see `enable_signal_toggle`),
+    when turned off the collected stacks are written out in the collapsed format used by flamegraph tools.
+    """
+
+    def __init__(self, slow_handler_threshold=5, watchdog_interval=0.5):
+        self.slow_handler_threshold = slow_handler_threshold  # Seconds, set to None to disable the watchdog
+        self.watchdog_interval = watchdog_interval
+
+        self.stats = {}  # Keyed by handler name: {'calls', 'total_time', 'max_time', 'slow_calls'}
+
+        self._lock = threading.Lock()
+        self._active_calls = {}  # Keyed by call id: [handler_name, thread_id, start_time, warned]
+        self._next_call_id = 0
+        self._watchdog = None
+
+        self.sampler = None
+        self._sampler_lock = threading.Lock()  # So two quick toggles can not start two samplers
+
+    @contextmanager
+    def profile(self, callback):
+        handler_name = _get_handler_name(callback)
+        start_time = time.perf_counter()
+
+        with self._lock:
+            call_id = self._next_call_id
+            self._next_call_id += 1
+            self._active_calls[call_id] = [handler_name, threading.get_ident(), start_time, False]
+
+        if self.slow_handler_threshold is not None:
+            self._start_watchdog()
+
+        try:
+            yield
+        finally:
+            run_time = time.perf_counter() - start_time
+            with self._lock:
+                warned = self._active_calls.pop(call_id)[3]
+                stats = self.stats.setdefault(handler_name, {'calls': 0,
+                                                             'total_time': 0.0,
+                                                             'max_time': 0.0,
+                                                             'slow_calls': 0,
+                                                             })
+                stats['calls'] += 1
+                stats['total_time'] += run_time
+                stats['max_time'] = max(stats['max_time'], run_time)
+
+            if (self.slow_handler_threshold is not None
+                    and run_time > self.slow_handler_threshold):
+                with self._lock:
+                    stats['slow_calls'] += 1
+                if warned:
+                    logger.warning("Slow handler `{handler}` finished after {run_time:.3f}s"
+                                   .format(handler=handler_name, run_time=run_time))
+                else:
+                    # Finished before the watchdog could catch it, still let the user know
+                    logger.warning("Slow handler `{handler}` took {run_time:.3f}s (threshold {threshold}s)"
+                                   .format(handler=handler_name,
+                                           run_time=run_time,
+                                           threshold=self.slow_handler_threshold))
+
+    def _start_watchdog(self):
+        if self._watchdog is not None and self._watchdog.is_alive():
+            return
+
+        with self._lock:
+            if self._watchdog is not None and self._watchdog.is_alive():
+                return
+            self._watchdog = threading.Thread(target=self._watch, name='slackbot-handler-watchdog', daemon=True)
+            self._watchdog.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watchdog_interval)
+            threshold = self.slow_handler_threshold
+            if threshold is None:
+                continue
+
+            now = time.perf_counter()
+            slow_calls = []
+            with self._lock:
+                for call in self._active_calls.values():
+                    if call[3] is False and now - call[2] > threshold:
+                        call[3] = True
+                        slow_calls.append((call[0], call[1], now - call[2]))
+
+            if not slow_calls:
+                continue
+
+            frames = sys._current_frames()
+            for handler_name, thread_id, run_time in slow_calls:
+                frame = frames.get(thread_id)
+                stack = ''.join(traceback.format_stack(frame)) if frame is not None else '<stack not available>\n'
+                logger.warning("Handler `{handler}` has been running for {run_time:.3f}s (threshold {threshold}s)"
+                               ", current stack:\n{stack}"
+                               .format(handler=handler_name, run_time=run_time, threshold=threshold, stack=stack))
+
+    def start_sampling(self, interval=0.005):
+        with self._sampler_lock:
+            self._start_sampling(interval=interval)
+
+    def _start_sampling(self, interval):
+        if self.sampler is None:
+            self.sampler = SamplingProfiler(interval=interval)
+            self.sampler.start()
+            logger.info("Sampling profiler started")
+
+    def stop_sampling(self, output_path='slackbot_profile.txt'):
+        """Stop the sampling profiler and write the collected stacks out
+
+        Returns:
+            str/None: The path the profile was written to, None if the profiler was not running
+
+        """
+        with self._sampler_lock:
+            return self._stop_sampling(output_path=output_path)
+
+    def _stop_sampling(self, output_path):
+        if self.sampler is None:
+            return None
+
+        sampler, self.sampler = self.sampler, None
+        sampler.stop()
+        sampler.write(output_path)
+        logger.info("Sampling profiler stopped, {count} samples written to {path}"
+                    .format(count=sum(sampler.samples.values()), path=output_path))
+        return output_path
+
+    def toggle_sampling(self, output_path='slackbot_profile.txt', interval=0.005):
+        with self._sampler_lock:
+            if self.sampler is None:
+                self._start_sampling(interval=interval)
+            else:
+                self._stop_sampling(output_path=output_path)
+
+    def enable_signal_toggle(self, signum=None, output_path='slackbot_profile.txt', interval=0.005):
+        """Turn the sampling profiler on/off each time the process gets `signum` (default `SIGUSR1`)
+
+        Needs to be called from the main thread, e.g. `kill -USR1 <pid>` to start and again to stop
+        """
+        if signum is None:
+            signum = signal.SIGUSR1
+
+        def _handle_signal(signum, frame):
+            # Do the work outside of the signal handler so we are not writing files in the middle of a handler
+            threading.Thread(target=self.toggle_sampling,
+                             kwargs={'output_path': output_path, 'interval': interval},
+                             daemon=True).start()
+
+        signal.signal(signum, _handle_signal)
+
+    def report(self):
+        """Get the collected handler timings, slowest handlers first
+        """
+        with self._lock:
+            stats = [dict(handler=name, **data) for name, data in self.stats.items()]
+
+        for data in stats:
+            data['avg_time'] = data['total_time'] / data['calls'] if data['calls'] else 0.0
+
+        return sorted(stats, key=lambda data: data['max_time'], reverse=True)
+
+
+class SamplingProfiler:
+    """Samples the stacks of every thread (besides its own) at a fixed interval
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._sample, name='slackbot-sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _sample(self):
+        own_thread_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('{func} ({file}:{line})'.format(func=code.co_name,
+                                                                 file=code.co_filename,
+                                                                 line=code.co_firstlineno))
+                    frame = frame.f_back
+
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def write(self, output_path):
+        with open(output_path, 'w') as out_file:
+            for stack, count in self.samples.most_common():
+                out_file.write('{stack} {count}\n'.format(stack=stack, count=count))
+
+
+def _get_handler_name(callback):
+    name = getattr(callback, '__qualname__', None) or getattr(callback, '__name__', repr(callback))
+    module = getattr(callback, '__module__', None)
+    if module:
+        return '{module}.{name}'.format(module=module, name=name)
+    return name
+
+
+# Shared by every `Parser` unless one is passed in
+handler_profiler = HandlerProfiler()
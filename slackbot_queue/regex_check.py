@@ -0,0 +1,112 @@
+"""Find regex patterns that can take a very long time to run (catastrophic backtracking)
+
+Only looks at the structure of the pattern, so it can have false positives and will not catch everything.
+"""
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Before python 3.11
+    import sre_parse
+    import sre_constants
+
+LARGE_REPEAT = 10  # Repeats that can match more then this many times count as unbounded
+
+_CATEGORY_CHECKS = {
+    sre_constants.CATEGORY_DIGIT: lambda ch: ch.isdigit(),
+    sre_constants.CATEGORY_NOT_DIGIT: lambda ch: not ch.isdigit(),
+    sre_constants.CATEGORY_SPACE: lambda ch: ch.isspace(),
+    sre_constants.CATEGORY_NOT_SPACE: lambda ch: not ch.isspace(),
+    sre_constants.CATEGORY_WORD: lambda ch: ch.isalnum() or ch == '_',
+    sre_constants.CATEGORY_NOT_WORD: lambda ch: not (ch.isalnum() or ch == '_'),
+}
+_SAMPLE_CHARS = [chr(i) for i in range(128)]
+
+
+def find_backtracking_risks(regex_str, flags=0):
+    """
+    Returns:
+        list: Reasons the pattern could backtrack heavily, empty if none were found
+
+    """
+    try:
+        parsed = sre_parse.parse(regex_str, flags)
+    except Exception:
+        # Let `re.compile` raise the real error
+        return []
+
+    risks = []
+    _check_sequence(list(parsed), risks, inside_repeat=False)
+    return risks
+
+
+def _check_sequence(items, risks, inside_repeat):
+    previous_repeat_chars = None
+    for op, av in items:
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            min_, max_, sub = av
+            is_large = max_ == sre_constants.MAXREPEAT or max_ > LARGE_REPEAT
+            if is_large and inside_repeat and min_ != max_:
+                risks.append("nested quantifier `{}`".format(_describe(op, av)))
+
+            repeat_chars = _single_char_set(list(sub)) if is_large else None
+            if repeat_chars and previous_repeat_chars and repeat_chars & previous_repeat_chars:
+                risks.append("adjacent repeats that can match the same characters")
+
+            previous_repeat_chars = repeat_chars
+            _check_sequence(list(sub), risks, inside_repeat=inside_repeat or (is_large and max_ > 1))
+            continue
+
+        if op == sre_constants.SUBPATTERN:
+            _check_sequence(list(av[-1]), risks, inside_repeat)
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                _check_sequence(list(branch), risks, inside_repeat)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            _check_sequence(list(av[1]), risks, inside_repeat)
+
+        # Anything else in between means the repeats are not next to each other anymore,
+        # unless its something that does not take up any characters (like `^` or `\b`)
+        if op not in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            previous_repeat_chars = None
+
+
+def _single_char_set(items):
+    """The sample characters a single character pattern (e.g. `.`, `\\w`, `[a-z]`) matches, None for anything else
+    """
+    if len(items) != 1:
+        return None
+
+    op, av = items[0]
+    if op not in (sre_constants.ANY, sre_constants.LITERAL, sre_constants.NOT_LITERAL, sre_constants.IN):
+        return None
+
+    return {ch for ch in _SAMPLE_CHARS if _char_matches(op, av, ch)}
+
+
+def _char_matches(op, av, ch):
+    if op == sre_constants.ANY:
+        return ch != '\n'
+    elif op == sre_constants.LITERAL:
+        return ord(ch) == av
+    elif op == sre_constants.NOT_LITERAL:
+        return ord(ch) != av
+    elif op == sre_constants.IN:
+        negate = False
+        matched = False
+        for item_op, item_av in av:
+            if item_op == sre_constants.NEGATE:
+                negate = True
+            elif item_op == sre_constants.LITERAL:
+                matched = matched or ord(ch) == item_av
+            elif item_op == sre_constants.RANGE:
+                matched = matched or item_av[0] <= ord(ch) <= item_av[1]
+            elif item_op == sre_constants.CATEGORY:
+                check = _CATEGORY_CHECKS.get(item_av)
+                matched = matched or (check is not None and check(ch))
+        return matched != negate
+    return False
+
+
+def _describe(op, av):
+    min_, max_, _ = av
+    max_str = '' if max_ == sre_constants.MAXREPEAT else str(max_)
+    return '{{{min},{max}}}'.format(min=min_, max=max_str)
@@ -0,0 +1,228 @@
+"""Run commands later, or over and over, without a worker waiting around for it
+
+Timers are kept in a hierarchical timer wheel so adding, cancelling and firing them does not depend on how
+many are waiting. When a timer is due its event is sent to the worker queue, the same as `worker.delay()`.
+"""
+import time
+import logging
+import threading
+import itertools
+
+logger = logging.getLogger(__name__)
+
+
+class Timer:
+    __slots__ = ('timer_id', 'expires_tick', 'due', 'every', 'payload', 'cancelled')
+
+    def __init__(self, timer_id, expires_tick, due, every, payload):
+        self.timer_id = timer_id
+        self.expires_tick = expires_tick
+        self.due = due  # Unix time
+        self.every = every
+        self.payload = payload
+        self.cancelled = False
+
+
+class TimerWheel:
+    """Hierarchical timer wheel
+
+    Level 0 has a slot per tick, each level above it covers `slots` times more ticks per slot.
+    Timers in the higher levels are moved down a level each time the level below it wraps around.
+    With the defaults (1s ticks, 64 slots, 4 levels) timers up to ~194 days out are placed directly,
+    anything later waits in the top level until it is close enough.
+
+    Args:
+        tick (float): Seconds per tick
+        slots (int): Slots in each level, needs to be a power of 2
+        levels (int): Number of levels
+
+    """
+
+    def __init__(self, tick=1.0, slots=64, levels=4, now=None):
+        if slots & (slots - 1):
+            raise ValueError("slots needs to be a power of 2")
+
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._bits = slots.bit_length() - 1
+        self._mask = slots - 1
+        self._max_delta = slots ** levels - 1
+
+        self.wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.current_tick = self.to_tick(time.time() if now is None else now)
+        self.count = 0
+
+    def to_tick(self, timestamp):
+        return int(timestamp // self.tick)
+
+    def add(self, timer, _min_tick=None):
+        min_tick = self.current_tick + 1 if _min_tick is None else _min_tick
+        expires_tick = max(timer.expires_tick, min_tick)
+        # Too far out, it is put as far out as it can go and placed again when it gets moved down
+        expires_tick = min(expires_tick, self.current_tick + self._max_delta)
+
+        delta = expires_tick - self.current_tick
+        level = 0
+        while level < self.levels - 1 and delta >= 1 << (self._bits * (level + 1)):
+            level += 1
+
+        slot = (expires_tick >> (self._bits * level)) & self._mask
+        self.wheels[level][slot].append(timer)
+        self.count += 1
+
+    def advance(self, now):
+        """Move the wheel forward to `now`
+
+        Returns:
+            list: The timers that are now due, including cancelled ones
+
+        """
+        now_tick = self.to_tick(now)
+        expired = []
+        if self.count == 0:
+            # Nothing to move down or fire, so skip straight there
+            self.current_tick = max(self.current_tick, now_tick)
+            return expired
+
+        while self.current_tick < now_tick:
+            self.current_tick += 1
+
+            # Move timers down from the highest level that wrapped, so they can keep moving down from there
+            for level in range(self.levels - 1, 0, -1):
+                if self.current_tick & ((1 << (self._bits * level)) - 1) == 0:
+                    slot = (self.current_tick >> (self._bits * level)) & self._mask
+                    timers, self.wheels[level][slot] = self.wheels[level][slot], []
+                    self.count -= len(timers)
+                    for timer in timers:
+                        self.add(timer, _min_tick=self.current_tick)
+
+            slot = self.current_tick & self._mask
+            timers, self.wheels[0][slot] = self.wheels[0][slot], []
+            self.count -= len(timers)
+            for timer in timers:
+                if timer.expires_tick > self.current_tick:
+                    # Was too far out when it was added, place it again
+                    self.add(timer)
+                else:
+                    expired.append(timer)
+
+        return expired
+
+
+class Scheduler:
+    """Keeps the timers and fires them from a background thread
+
+    Args:
+        fire (callable): Passed the payload of each timer when it is due
+        tick (float): Seconds between checking for due timers, this is the most a timer can be late by
+
+    """
+
+    def __init__(self, fire, tick=1.0):
+        self.fire = fire
+        self.wheel = TimerWheel(tick=tick)
+        self.fired = 0
+
+        self._timers = {}  # Keyed by timer id
+        self._timer_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def __len__(self):
+        return len(self._timers)
+
+    def add(self, payload, delay=None, at=None, every=None):
+        """Add a timer
+
+        Args:
+            payload (dict): Passed to `fire` when the timer is due
+            delay (float): Seconds from now
+            at (float): Unix time
+            every (float): Fire again every this many seconds, the first time is `delay`/`at` or `every` from now
+
+        Returns:
+            int: Timer id, used to `cancel()` it
+
+        """
+        if at is None:
+            if delay is None:
+                delay = every
+            if delay is None:
+                raise ValueError("Need one of `delay`, `at` or `every` to schedule a timer")
+            at = time.time() + delay
+
+        with self._lock:
+            timer = Timer(next(self._timer_ids), self.wheel.to_tick(at), at, every, payload)
+            payload['scheduled']['timer_id'] = timer.timer_id
+            self._timers[timer.timer_id] = timer
+            self.wheel.add(timer)
+        return timer.timer_id
+
+    def cancel(self, timer_id):
+        """
+        Returns:
+            bool: False if there is no timer with that id (or it already fired)
+
+        """
+        with self._lock:
+            timer = self._timers.pop(timer_id, None)
+            if timer is None:
+                return False
+            # It is skipped when its slot comes around
+            timer.cancelled = True
+            return True
+
+    def start(self):
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='slackbot-scheduler', daemon=True)
+        self._thread.start()
+        logger.info("Scheduler started with {count} timers".format(count=len(self._timers)))
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_pending(self, now=None):
+        """Fire every timer that is due
+        """
+        if now is None:
+            now = time.time()
+
+        due = []
+        with self._lock:
+            for timer in self.wheel.advance(now):
+                if timer.cancelled:
+                    continue
+
+                due.append((timer.timer_id, timer.payload, timer.due))
+                if timer.every:
+                    # Based on when it was due, not when it ran, so it does not drift
+                    timer.due += timer.every
+                    while timer.due <= now:
+                        timer.due += timer.every
+                    timer.expires_tick = self.wheel.to_tick(timer.due)
+                    self.wheel.add(timer)
+                else:
+                    self._timers.pop(timer.timer_id, None)
+
+        for timer_id, payload, due_at in due:
+            try:
+                self.fire(dict(payload, scheduled=dict(payload['scheduled'], due=due_at)))
+                self.fired += 1
+            except Exception:
+                logger.exception("Failed to fire timer {timer_id}: {payload}".format(timer_id=timer_id,
+                                                                                     payload=payload))
+
+    def _run(self):
+        while not self._stop_event.wait(self.wheel.tick):
+            self.run_pending()
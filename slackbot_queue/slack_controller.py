@@ -2,22 +2,45 @@ import os
 import re
 import time
 import json
+import inspect
 import logging
-import urllib.error
-import urllib.request
-from celery import Celery
-from collections import defaultdict
-from slackclient import SlackClient
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from slackbot_queue.profiling import handler_profiler
+from slackbot_queue.backpressure import InboundBuffer
+from slackbot_queue.dedup import EventDeduplicator
+from slackbot_queue.actions import get_executor, is_multi_action, run_actions
+from slackbot_queue.regex_check import find_backtracking_risks
+from slackbot_queue.directory import Directory
+from slackbot_queue.scheduler import Scheduler
 
 logger = logging.getLogger(__name__)
 
+# The controller whose event is being handled on this thread, see `SlackController.activated()`
+_active_controller = threading.local()
 
-class Parser:
 
-    def __init__(self):
+class Parser:
+    # Regex matches that take longer then this many seconds count as slow.
+    # After `max_slow_matches` slow matches the pattern is turned off for `disable_time` seconds
+    match_time_budget = 0.1
+    max_slow_matches = 3
+    disable_time = 300
+
+    def __init__(self, profiler=None):
+        # Every handler call is timed so slow ones can be found, see `slackbot_queue.profiling`
+        self.profiler = profiler if profiler is not None else handler_profiler
         self.message_listener = defaultdict(list)
         self.reaction_added_listener = defaultdict(list)
         self.file_share_listener = defaultdict(list)
+        self.scheduled_listener = defaultdict(list)
+
+        self.slow_matches = Counter()  # Keyed by the regex string
+        self._strikes = Counter()  # Slow matches since the pattern was last turned off
+        self._disabled_until = {}
+        # Files from the same share are matched on more then one thread at once, see `handle_file_share_event`
+        self._slow_match_lock = threading.Lock()
 
     def trigger(self, *args, **kwargs):
         event_type = args[0]
@@ -28,10 +51,12 @@ class Parser:
             return self._reaction_added(*args[1:], **kwargs)
         elif event_type == 'file_share':
             return self._file_share(*args[1:], **kwargs)
+        elif event_type == 'scheduled':
+            return self._scheduled(*args[1:], **kwargs)
 
     def _message(self, regex_str, flags=0):
         def wrapper(func):
-            parse_with = re.compile(regex_str, flags)
+            parse_with = self._compile(regex_str, flags)
             self.message_listener[func].append(parse_with)
             logger.info("Registered listener `{func_name}` to regex `{regex_str}`".format(func_name=func.__name__,
                                                                                           regex_str=regex_str))
@@ -41,8 +66,8 @@ class Parser:
 
     def _reaction_added(self, reaction_regex, message_regex='.*', flags=0):
         def wrapper(func):
-            reaction_parse = re.compile(reaction_regex, flags)
-            message_parse = re.compile(message_regex, flags)
+            reaction_parse = self._compile(reaction_regex, flags)
+            message_parse = self._compile(message_regex, flags)
             self.reaction_added_listener[func].append({'reaction': reaction_parse,
                                                        'message': message_parse})
             logger.info("Registered listener `{func_name}` to regex `{reaction_regex}` & `{message_regex}`"
@@ -56,8 +81,8 @@ class Parser:
 
     def _file_share(self, filetype_regex, name_regex='.*', flags=0):
         def wrapper(func):
-            filetype_parse = re.compile(filetype_regex, flags)
-            name_parse = re.compile(name_regex, flags)
+            filetype_parse = self._compile(filetype_regex, flags)
+            name_parse = self._compile(name_regex, flags)
             self.file_share_listener[func].append({'filetype': filetype_parse,
                                                    'name': name_parse})
             logger.info("Registered listener `{func_name}` to regex `{filetype_regex}` & `{name_regex}`"
@@ -68,64 +93,171 @@ class Parser:
 
         return wrapper
 
+    def _scheduled(self, name_regex, flags=0):
+        def wrapper(func):
+            parse_with = self._compile(name_regex, flags)
+            self.scheduled_listener[func].append(parse_with)
+            logger.info("Registered scheduled listener `{func_name}` to regex `{name_regex}`"
+                        .format(func_name=func.__name__, name_regex=name_regex))
+            return func
+
+        return wrapper
+
+    def _compile(self, regex_str, flags):
+        for risk in find_backtracking_risks(regex_str, flags):
+            logger.warning("Regex `{regex_str}` could be slow to match, {risk}".format(regex_str=regex_str, risk=risk))
+
+        return re.compile(regex_str, flags)
+
+    def _search(self, pattern, string):
+        """`re.search` that keeps track of how long each pattern takes, skipping the ones that are turned off
+
+        Python can not stop a regex part way through, so a slow match still runs once it has started.
+        """
+        if pattern in self._disabled_until:
+            with self._slow_match_lock:
+                # Checked again with the lock held, another thread could have turned it back on (or off) since
+                if time.monotonic() < self._disabled_until.get(pattern, 0):
+                    return None
+                turned_on = self._disabled_until.pop(pattern, None) is not None
+            if turned_on:
+                logger.info("Turned regex `{regex_str}` back on".format(regex_str=pattern.pattern))
+
+        start_time = time.perf_counter()
+        result = pattern.search(string)
+        run_time = time.perf_counter() - start_time
+
+        if run_time > self.match_time_budget:
+            with self._slow_match_lock:
+                self.slow_matches[pattern.pattern] += 1
+                self._strikes[pattern] += 1
+                disable = self._strikes[pattern] >= self.max_slow_matches
+                if disable:
+                    del self._strikes[pattern]
+                    self._disabled_until[pattern] = time.monotonic() + self.disable_time
+
+            logger.warning("Regex `{regex_str}` took {run_time:.3f}s to match against {length} characters"
+                           .format(regex_str=pattern.pattern, run_time=run_time, length=len(string)))
+
+            if disable:
+                logger.error("Turned regex `{regex_str}` off for {disable_time}s after {count} slow matches"
+                             .format(regex_str=pattern.pattern, disable_time=self.disable_time,
+                                     count=self.max_slow_matches))
+
+        return result
+
     def parse_message(self, message_str, **kwargs):
         for callback in self.message_listener:
             for command in self.message_listener[callback]:
-                result = re.search(command, message_str)
+                result = self._search(command, message_str)
+                if result is not None:
+                    if len(result.groupdict().keys()) != 0:
+                        rdata = self._call_handler(callback, message_str, **result.groupdict(), **kwargs)
+                    else:
+                        rdata = self._call_handler(callback, message_str, *result.groups(), **kwargs)
+
+                    return rdata
+
+    def parse_scheduled(self, name_str, **kwargs):
+        for callback in self.scheduled_listener:
+            for command in self.scheduled_listener[callback]:
+                result = self._search(command, name_str)
                 if result is not None:
                     if len(result.groupdict().keys()) != 0:
-                        rdata = callback(message_str, **result.groupdict(), **kwargs)
+                        rdata = self._call_handler(callback, name_str, **result.groupdict(), **kwargs)
                     else:
-                        rdata = callback(message_str, *result.groups(), **kwargs)
+                        rdata = self._call_handler(callback, name_str, *result.groups(), **kwargs)
 
                     return rdata
 
     def parse_reaction(self, reaction_str, message_str, **kwargs):
         for callback in self.reaction_added_listener:
             for command in self.reaction_added_listener[callback]:
-                reaction_result = re.search(command['reaction'], reaction_str)
-                message_result = re.search(command['message'], message_str)
+                reaction_result = self._search(command['reaction'], reaction_str)
+                message_result = self._search(command['message'], message_str)
                 if reaction_result is not None and message_result is not None:
                     # BUG: Both regexes need to use named groups or normal groups, cannot be mixed
                     if len(reaction_result.groupdict().keys()) != 0:
-                        rdata = callback(reaction_str, message_str,
-                                         **reaction_result.groupdict(), **message_result.groupdict(), **kwargs)
+                        rdata = self._call_handler(callback, reaction_str, message_str,
+                                                   **reaction_result.groupdict(), **message_result.groupdict(),
+                                                   **kwargs)
                     else:
-                        rdata = callback(reaction_str, message_str,
-                                         *reaction_result.groups(), *message_result.groups(), **kwargs)
+                        rdata = self._call_handler(callback, reaction_str, message_str,
+                                                   *reaction_result.groups(), *message_result.groups(), **kwargs)
                     return rdata
 
     def parse_file_share(self, filetype_str, name_str, **kwargs):
         for callback in self.file_share_listener:
             for command in self.file_share_listener[callback]:
-                filetype_result = re.search(command['filetype'], filetype_str)
-                name_result = re.search(command['name'], name_str)
+                filetype_result = self._search(command['filetype'], filetype_str)
+                name_result = self._search(command['name'], name_str)
                 if filetype_result is not None and name_result is not None:
                     # BUG: Both regexes need to use named groups or normal groups, cannot be mixed
                     if len(filetype_result.groupdict().keys()) != 0:
-                        rdata = callback(filetype_str, name_str,
-                                         **filetype_result.groupdict(), **name_result.groupdict(), **kwargs)
+                        rdata = self._call_handler(callback, filetype_str, name_str,
+                                                   **filetype_result.groupdict(), **name_result.groupdict(),
+                                                   **kwargs)
                     else:
-                        rdata = callback(filetype_str, name_str,
-                                         *filetype_result.groups(), *name_result.groups(), **kwargs)
+                        rdata = self._call_handler(callback, filetype_str, name_str,
+                                                   *filetype_result.groups(), *name_result.groups(), **kwargs)
                     return rdata
 
+    def _call_handler(self, callback, *args, **kwargs):
+        if inspect.isgeneratorfunction(callback):
+            # Calling it only creates the generator, the handler runs as its actions are sent
+            return self._profile_generator(callback, callback(*args, **kwargs))
+
+        with self.profiler.profile(callback):
+            return callback(*args, **kwargs)
+
+    def _profile_generator(self, callback, generator):
+        with self.profiler.profile(callback):
+            return (yield from generator)
+
 
 class SlackController:
 
     def __init__(self):
         self.Parser = Parser
+        self.profiler = handler_profiler  # Shared with every `Parser`, used to tune the slow handler threshold
         self.channel_to_actions = defaultdict(list)  # Filled in by the user
 
         # Defaults for the help message
         self.help_message_regex = None  # The user can override this, or it will default to whats in the setup()
 
+        # Events wait here before being handled, see `set_inbound_limits()`
+        self.inbound = InboundBuffer(defer=self._defer_event)
+        # Skips events that have already been seen, the window and size can be changed on it
+        self.seen_events = EventDeduplicator()
+
+        # The fields kept for each user & channel, `None` keeps everything slack returns.
+        # Set to a list of fields (e.g. `slackbot_queue.directory.DEFAULT_USER_FIELDS`) to save memory,
+        # needs to be changed before `setup()` is called
+        self.user_fields = None
+        self.channel_fields = None
+
+        # Timers from `schedule()`, only run by the listener
+        self.scheduler = Scheduler(fire=self._fire_scheduled)
+        # Set to False before adding the commands when more then one listener is running (e.g. Events API
+        # replicas), so only one of them fires the recurring timers. The others send one off timers to the queue
+        self.run_scheduler = True
+        self._is_worker_process = False
+
+    def set_inbound_limits(self, **kwargs):
+        """Set how many events can be waiting to be handled and how fast users & channels can send them
+
+        Takes the same args as `slackbot_queue.backpressure.InboundBuffer`, e.g.
+        `set_inbound_limits(max_size=500, overflow_policy='drop_by_channel', user_rate=1, user_burst=5)`
+        """
+        kwargs.setdefault('defer', self._defer_event)
+        self.inbound = InboundBuffer(**kwargs)
+
     def add_commands(self, channel_commands):
         for channel, commands in channel_commands.items():
             for command in commands:
                 self.channel_to_actions[channel].append(command)
 
-    def setup(self, slack_bot_token=None):
+    def setup(self, slack_bot_token=None, slack_client=None):
         # Do not have this in __init__ because this is not needed when running tests
         self.SLACK_BOT_TOKEN = slack_bot_token
         if self.SLACK_BOT_TOKEN is None:
@@ -134,12 +266,19 @@ class SlackController:
         if self.SLACK_BOT_TOKEN is None:
             raise ValueError("Missing SLACK_BOT_TOKEN")
 
-        self.slack_client = SlackClient(self.SLACK_BOT_TOKEN)
+        # A client can be passed in to talk to something other then slack, see `slackbot_queue.replay`
+        self.slack_client = slack_client
+        if self.slack_client is None:
+            # Imported here so processes that never talk to slack do not pay for it
+            from slackclient import SlackClient
+            self.slack_client = SlackClient(self.SLACK_BOT_TOKEN)
         self.channels = self._get_channel_list()
         # self.channels.update(self._get_group_list())
         self.users = self._get_user_list()
         self.ims = self._get_im_list()
-        self.BOT_ID = self.slack_client.api_call('auth.test')['user_id']
+        auth = self.slack_client.api_call('auth.test')
+        self.BOT_ID = auth['user_id']
+        self.TEAM_ID = auth.get('team_id')
         self.BOT_NAME = '<@{}>'.format(self.BOT_ID)
 
         if self.help_message_regex is None:
@@ -177,43 +316,170 @@ class SlackController:
         return message_data
 
     def start_worker(self, argv=[]):
+        self._is_worker_process = True
         queue.start(argv=argv)
 
-    def start_listener(self):
+    def schedule(self, name, delay=None, at=None, every=None, channel=None, user=None, data=None):
+        """Trigger the commands listening for `name` (`parser.trigger('scheduled', name)`) later on the worker
+
+        Args:
+            name (str): Matched against the `scheduled` triggers
+            delay (float): Seconds from now
+            at (float): Unix time
+            every (float): Run again every this many seconds
+            channel (str): Channel id or name, only the commands in this channel are checked and it is where
+                           the response is posted. If not set every command is checked
+            user (str): User id or name, set as `full_event['user']`
+            data: Anything that can be json encoded, set as `full_event['scheduled']['data']`
+
+        Returns:
+            int/None: Timer id to pass to `cancel_scheduled()`, None when called on the worker
+
+        """
+        if delay is None and at is None and every is None:
+            raise ValueError("Need one of `delay`, `at` or `every` to schedule a timer")
+
+        payload = {'scheduled': {'name': name, 'data': data, 'timer_id': None},
+                   'channel': channel,
+                   'user': user,
+                   'team_id': getattr(self, 'TEAM_ID', None),
+                   }
+
+        if self._is_worker_process or not self.run_scheduler:
+            # The timers only run in the listener running the scheduler. One off timers can go to the queue to
+            # wait instead, recurring ones are skipped since that listener sets up the same ones when it loads
+            # the commands
+            if every is not None:
+                if get_active_controller() is not None:
+                    # Called by a command, skipping it would lose it
+                    raise RuntimeError("Can not schedule recurring `{name}` while handling an event here, recurring"
+                                       " timers can only be added by the listener running the scheduler"
+                                       .format(name=name))
+                logger.debug("Not scheduling recurring `{name}`, the scheduler is not run here".format(name=name))
+                return None
+
+            countdown = delay if delay is not None else at - time.time()
+            payload['scheduled']['due'] = time.time() + countdown
+            worker.apply_async(args=[json.dumps(payload)], countdown=max(0, countdown))
+            return None
+
+        return self.scheduler.add(payload, delay=delay, at=at, every=every)
+
+    def cancel_scheduled(self, timer_id):
+        return self.scheduler.cancel(timer_id)
+
+    def _fire_scheduled(self, payload):
+        worker.delay(json.dumps(payload))
+
+    def start_listener(self, record_to=None):
+        """Listen for events over RTM
+
+        Args:
+            record_to (str): If set, every event is also appended to this jsonl file
+                             so it can be replayed later with `slackbot_queue.replay`
+
+        """
         RTM_READ_DELAY = 1  # noqa, 1 second delay between reading from RTM
 
+        recorder = None
+        if record_to is not None:
+            from slackbot_queue.replay import EventRecorder
+            recorder = EventRecorder(record_to)
+
         if self.slack_client.rtm_connect(with_team_state=False):
             logger.info("Starter Bot connected and running!")
+            if self.run_scheduler:
+                self.scheduler.start()
 
-            while True:
-                self.parse_event(self.slack_client.rtm_read())
-                time.sleep(RTM_READ_DELAY)
+            try:
+                while True:
+                    slack_events = self.slack_client.rtm_read()
+                    if recorder is not None:
+                        recorder.record(slack_events)
+                    self.parse_event(slack_events)
+                    time.sleep(RTM_READ_DELAY)
+            finally:
+                if recorder is not None:
+                    recorder.close()
         else:
             logger.error("Connection failed. Exception traceback printed above.")
 
+    def start_events_listener(self, signing_secret=None, host='0.0.0.0', port=3000, path='/slack/events',
+                              max_pending=1000):
+        """Listen for events from the Events API over http, instead of RTM
+
+        Args:
+            signing_secret (str): From the slack app settings, defaults to the env var `SLACK_SIGNING_SECRET`
+            max_pending (int): Events waiting to be handled before new ones are answered with a `503`
+                so slack retries them later. The inbound limits apply to each batch taken from these.
+
+        """
+        from slackbot_queue.events_api import EventsApiServer
+
+        if signing_secret is None:
+            signing_secret = os.environ.get('SLACK_SIGNING_SECRET')
+
+        server = EventsApiServer(self, signing_secret, host=host, port=port, path=path, max_pending=max_pending)
+        if self.run_scheduler:
+            self.scheduler.start()
+        server.serve_forever()
+
     def parse_event(self, slack_events):
         """
             Parses a list of events coming from the Slack RTM API to find bot commands.
-            If a bot command is found, this function returns a tuple of command and channel.
-            If its not found, then this function returns None, None.
+            Repeated events are skipped and the rest go through the inbound buffer
+            so floods are shed before any lookups are done.
         """
         for event in slack_events:
             logger.debug("Event:\n{event}".format(event=event))
-            try:
-                if (event['type'] == 'message'
-                        and (event.get('subtype', None) not in ['message_changed', 'message_deleted',
-                                                                'file_share', 'message_replied']
-                             and not event.get('files'))):
-                    self.handle_message_event(event)
-                elif event['type'] in ['reaction_added']:
-                    self.handle_reaction_event(event)
-                elif event.get('files'):
-                    self.handle_file_share_event(event)
-                else:
-                    # Can handle other things like reactions and such
-                    pass
-            except Exception:
-                logger.exception("Failed to parse event: {event}".format(event=event))
+            if self._get_event_handler(event) is not None and not self.seen_events.is_duplicate(event):
+                self.inbound.put(event)
+
+        while True:
+            event = self.inbound.get()
+            if event is None:
+                break
+            self._dispatch_event(event)
+
+    def _get_event_handler(self, event):
+        if (event.get('type') == 'message'
+                and (event.get('subtype', None) not in ['message_changed', 'message_deleted',
+                                                        'file_share', 'message_replied']
+                     and not event.get('files'))):
+            return self.handle_message_event
+        elif event.get('type') in ['reaction_added']:
+            return self.handle_reaction_event
+        elif event.get('files'):
+            return self.handle_file_share_event
+        else:
+            # Can handle other things like reactions and such
+            return None
+
+    def _dispatch_event(self, event):
+        try:
+            handler = self._get_event_handler(event)
+            if handler is not None:
+                with self.activated():
+                    handler(event)
+        except Exception:
+            logger.exception("Failed to parse event: {event}".format(event=event))
+
+    @contextmanager
+    def activated(self):
+        """Mark this controller as the one handling the current event on this thread
+
+        Needed when commands are shared between workspaces, see `slackbot_queue.multi_workspace`
+        """
+        previous = getattr(_active_controller, 'value', None)
+        _active_controller.value = self
+        try:
+            yield self
+        finally:
+            _active_controller.value = previous
+
+    def _defer_event(self, event):
+        # RTM events like `reaction_added` have no `team`, the worker needs it to know which workspace to use
+        deferred_event.delay(json.dumps(dict(event, team=event.get('team', getattr(self, 'TEAM_ID', None)))))
 
     def _get_all_channel_commands(self, full_data):
         # Get all commands in channel
@@ -233,6 +499,7 @@ class SlackController:
             # Get the mesage that the reaction was added to
             full_data = {'reaction': reaction_event,
                          'user': self._get_user_data(reaction_event['user']),
+                         'team_id': self.TEAM_ID,
                          }
 
             if reaction_event['item']['type'] == 'message':
@@ -306,12 +573,11 @@ class SlackController:
                                                                 message_text,
                                                                 full_event=full_data)
                 if parsed_response is not None:
-                    response.update(parsed_response)
                     break
 
             if parsed_response is not None:
                 # Only post a message if needed
-                self.slack_client.api_call(**response)
+                self._send_response(parsed_response, response)
 
     def handle_message_event(self, message_event):
         if 'type' in message_event:
@@ -322,6 +588,7 @@ class SlackController:
             full_data = {'channel': channel_data,
                          'message': message_event,
                          'user': user_data,
+                         'team_id': self.TEAM_ID,
                          }
         else:
             # It came from the worker queue, meaning the message_event already has the full data
@@ -349,18 +616,14 @@ class SlackController:
                     parsed_response = command.parser.parse_message(full_data['message']['text'],
                                                                    full_event=full_data)
                     if parsed_response is not None:
-                        response.update(parsed_response)
                         break
             else:
                 # The help command was triggered
                 parsed_response = self.help(all_channel_commands, self.slack_client, full_event=full_data)
-                if parsed_response is not None:
-                    response.update(parsed_response)
 
             if parsed_response is not None:
                 # Only post a message if needed
-                response = self.slack_client.api_call(**response)
-                logger.debug("Slack api response: {response}".format(response=response))
+                self._send_response(parsed_response, response)
 
     def handle_file_share_event(self, file_share_event):
         if 'type' in file_share_event:
@@ -371,6 +634,7 @@ class SlackController:
             full_data = {'channel': channel_data,
                          'file_share': file_share_event,
                          'user': user_data,
+                         'team_id': self.TEAM_ID,
                          }
         else:
             # It came from the worker queue, meaning the file_share_event already has the full data
@@ -391,26 +655,119 @@ class SlackController:
             # Get all commands in channel
             all_channel_commands = self._get_all_channel_commands(full_data)
 
+            if 'type' not in file_share_event and full_data['file_share'].get('file') is not None:
+                # From the worker, only the file the command was triggered for needs to be checked again
+                files = [full_data['file_share']['file']]
+            else:
+                files = full_data['file_share']['files']
+
+            if len(files) == 1:
+                file_responses = [self._parse_file(files[0], full_data, all_channel_commands, response)]
+            else:
+                # Each file is checked at the same time, any downloads or slow commands do not hold up the others
+                futures = [get_executor('files').submit(self._parse_file, file_, full_data, all_channel_commands,
+                                                        response)
+                           for file_ in files]
+                file_responses = [future.result() for future in futures]
+
+            file_responses = [file_response for file_response in file_responses if file_response is not None]
+            if file_responses:
+                # Only post a message if needed
+                self._send_response(self._merge_file_responses(file_responses), response)
+
+    def _parse_file(self, file_, full_data, all_channel_commands, response):
+        """Check a single file from a file share against the commands
+
+        Returns:
+            dict/None: The message to post if it can be combined with the other files, otherwise it is sent here
+
+        """
+        # To keep the commands in bots compatable with old syntax, each file gets its own `file` key
+        file_data = dict(full_data, file_share=dict(full_data['file_share'], file=file_))
+
+        with self.activated():
             parsed_response = None
-            # To keep the commands in bots compatable with old syntax
-            full_data['file_share']['file'] = full_data['file_share']['files'][0]
             for command in all_channel_commands:
-                parsed_response = command.parser.parse_file_share(full_data['file_share']['file']['filetype'],
-                                                                  full_data['file_share']['file']['name'],
-                                                                  full_event=full_data)
+                parsed_response = command.parser.parse_file_share(file_['filetype'],
+                                                                  file_['name'],
+                                                                  full_event=file_data)
                 if parsed_response is not None:
-                    response.update(parsed_response)
                     break
 
+            if parsed_response is None:
+                return None
+
+            if (isinstance(parsed_response, dict)
+                    and parsed_response.get('method', response['method']) == 'chat.postMessage'):
+                return parsed_response
+
+            self._send_response(parsed_response, dict(response))
+            return None
+
+    def _merge_file_responses(self, file_responses):
+        # Post a single message for all of the files instead of one per file
+        if len(file_responses) == 1:
+            return file_responses[0]
+
+        merged = dict(file_responses[0])
+        merged['text'] = '\n'.join(file_response['text'] for file_response in file_responses
+                                   if file_response.get('text'))
+        merged['attachments'] = [attachment for file_response in file_responses
+                                 for attachment in file_response.get('attachments', [])]
+        return merged
+
+    def handle_scheduled_event(self, full_data):
+        # Always comes from the worker queue, the channel & user are looked up here since it could be days later
+        if isinstance(full_data.get('channel'), str):
+            full_data['channel'] = self._get_channel_data(full_data['channel'])
+        if isinstance(full_data.get('user'), str):
+            full_data['user'] = self._get_user_data(full_data['user'])
+
+        response = {'as_user': True,  # Should not be changed
+                    'method': 'chat.postMessage',
+                    }
+        if full_data.get('channel') is not None:
+            response['channel'] = full_data['channel']['id']
+            all_channel_commands = self._get_all_channel_commands(full_data)
+        else:
+            # Not for any channel, check every command
+            all_channel_commands = []
+            for commands in self.channel_to_actions.values():
+                for command in commands:
+                    if command not in all_channel_commands:
+                        all_channel_commands.append(command)
+
+        parsed_response = None
+        for command in all_channel_commands:
+            parsed_response = command.parser.parse_scheduled(full_data['scheduled']['name'], full_event=full_data)
             if parsed_response is not None:
-                # Only post a message if needed
-                response = self.slack_client.api_call(**response)
-                logger.debug("Slack api response: {response}".format(response=response))
+                break
+
+        if parsed_response is not None:
+            # Only post a message if needed
+            self._send_response(parsed_response, response)
+
+    def _send_response(self, parsed_response, response):
+        """Post what the handler returned
+
+        Args:
+            parsed_response (dict/list/generator): A single dict to send, or many actions (see `slackbot_queue.actions`)
+            response (dict): Defaults for the `channel`, `method`, etc. that the handler can override
+
+        """
+        if is_multi_action(parsed_response):
+            return run_actions(self.slack_client, parsed_response, response)
+
+        response.update(parsed_response)
+        response = self.slack_client.api_call(**response)
+        logger.debug("Slack api response: {response}".format(response=response))
+        return response
 
     def _get_channel_data(self, channel):
         channel_data = None
         for _ in range(2):
             if channel in self.channels:
+                # With `channel_fields` set this is a new dict each time, otherwise it is the cached slack object
                 channel_data = self.channels[channel]
 
             elif channel in self.ims:
@@ -437,26 +794,45 @@ class SlackController:
         return user_data
 
     def _get_channel_list(self):
-        channels_call = self.slack_client.api_call(
-            "conversations.list",
-            limit=1000,
-            exclude_archived=1,
-            types="public_channel,private_channel",  # include all types of channels in comma-separated str
-        )
-        logger.debug("_get_channel_list: " + str(channels_call))
-        if channels_call['ok']:
-            # some channels don't have names, so need filter them out. Same with IDs just to be safe
-            by_id = {item['id']: item for item in channels_call['channels'] if 'id' in item}
-            by_name = {item['name']: item for item in channels_call['channels'] if 'name' in item}
-            return {**by_id, **by_name}
+        channels = Directory(self.channel_fields)
+        # some channels don't have names, so `Directory` filters them out. Same with IDs just to be safe
+        if self._load_pages(channels, 'channels', 'conversations.list',
+                            limit=1000,
+                            exclude_archived=1,
+                            types="public_channel,private_channel",  # all types of channels in comma-separated str
+                            ):
+            return channels
 
     def _get_user_list(self):
-        users_call = self.slack_client.api_call("users.list")
-        logger.debug("_get_user_list: " + str(users_call))
-        if users_call['ok']:
-            by_id = {item['id']: item for item in users_call['members']}
-            by_name = {item['name']: item for item in users_call['members']}
-            return {**by_id, **by_name}
+        users = Directory(self.user_fields)
+        if self._load_pages(users, 'members', 'users.list', limit=1000):
+            return users
+
+    def _load_pages(self, directory, items_key, method, **kwargs):
+        """Add every page of results to the directory, one page at a time so the full list is never all in memory
+
+        Returns:
+            bool: False if a call failed
+
+        """
+        cursor = None
+        while True:
+            if cursor:
+                kwargs['cursor'] = cursor
+            api_call = self.slack_client.api_call(method, **kwargs)
+            logger.debug("{method}: ok={ok} count={count}".format(method=method,
+                                                                  ok=api_call.get('ok'),
+                                                                  count=len(api_call.get(items_key, []))))
+            if not api_call['ok']:
+                logger.error("{method} failed: {error}".format(method=method, error=api_call.get('error')))
+                return False
+
+            for item in api_call[items_key]:
+                directory.add(item)
+
+            cursor = api_call.get('response_metadata', {}).get('next_cursor')
+            if not cursor:
+                return True
 
     def _get_im_list(self):
         ims_call = self.slack_client.api_call(
@@ -484,6 +860,9 @@ class SlackController:
         """
         file_ is either a string (filename & path) to save the data to, or an in-memory object
         """
+        import urllib.error
+        import urllib.request
+
         rdata = None
         base_dir = 'tmp_downloads'
 
@@ -519,17 +898,127 @@ class SlackController:
         return rdata
 
 
+class LazyCelery:
+    """Stand in for the Celery app, celery is only imported and the app created the first time it is used
+
+    Anything done to this (e.g. `queue.conf.broker_url = '...'`) is done to the real app.
+    """
+
+    def __init__(self):
+        object.__setattr__(self, '_app', None)
+        object.__setattr__(self, '_tasks', [])
+
+    @property
+    def app(self):
+        if self._app is None:
+            from celery import Celery
+            object.__setattr__(self, '_app', Celery())
+            for task in self._tasks:
+                task._register(self._app)
+        return self._app
+
+    def task(self, *args, **opts):
+        """Same as `Celery.task`, used as `@queue.task`, `@queue.task()` or `@queue.task(bind=True, ...)`
+        """
+        def create_task(func):
+            task = LazyTask(func, **opts)
+            self._tasks.append(task)
+            if self._app is not None:
+                task._register(self._app)
+            return task
+
+        if len(args) == 1 and callable(args[0]):
+            return create_task(args[0])
+        if args:
+            raise TypeError("argument 1 to @task() must be a callable")
+        return create_task
+
+    def __getattr__(self, name):
+        return getattr(self.app, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.app, name, value)
+
+
+class LazyTask:
+    """A task that is added to the Celery app when the app is created
+
+    Calling it runs the function right away, the same as a celery task
+
+    Args:
+        func (callable): The task function
+        **opts: Passed to `Celery.task` (`name`, `bind`, ...)
+
+    """
+
+    def __init__(self, func, **opts):
+        self.func = func
+        self.opts = opts
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+        self._task = None
+
+    def _register(self, app):
+        opts = dict(self.opts)
+        # Same name celery gives it when using `@app.task`, so queued tasks still find it
+        name = opts.pop('name', None)
+        if name is None:
+            name = '{module}.{name}'.format(module=self.func.__module__, name=self.func.__name__)
+        self._task = app.task(self.func, name=name, **opts)
+
+    def __call__(self, *args, **kwargs):
+        if self.opts.get('bind'):
+            # The function needs the celery task passed in as `self`
+            return self._get_task()(*args, **kwargs)
+        return self.func(*args, **kwargs)
+
+    def _get_task(self):
+        if self._task is None:
+            # Creating the app registers the tasks
+            queue.app
+        return self._task
+
+    def __getattr__(self, name):
+        # `delay()`, `apply_async()`, ...
+        return getattr(self._get_task(), name)
+
+
 slack_controller = SlackController()
-queue = Celery()
+queue = LazyCelery()
+
+# Controllers for each workspace by team id, filled in by `MultiWorkspaceController.add_workspace()`
+workspace_controllers = {}
+
+
+def get_active_controller():
+    """The controller handling the current event on this thread, `None` if there is not one
+    """
+    return getattr(_active_controller, 'value', None)
+
+
+def _get_worker_controller(team_id):
+    # Events from the queue need to be handled by the controller for the workspace they came from
+    return workspace_controllers.get(team_id, slack_controller)
 
 
 @queue.task
 def worker(full_event):
     full_event = json.loads(full_event)
     full_event['is_worker'] = True
-    if 'reaction' in full_event:
-        slack_controller.handle_reaction_event(full_event)
-    elif 'file_share' in full_event:
-        slack_controller.handle_file_share_event(full_event)
-    else:
-        slack_controller.handle_message_event(full_event)
+    controller = _get_worker_controller(full_event.get('team_id'))
+    with controller.activated():
+        if 'scheduled' in full_event:
+            controller.handle_scheduled_event(full_event)
+        elif 'reaction' in full_event:
+            controller.handle_reaction_event(full_event)
+        elif 'file_share' in full_event:
+            controller.handle_file_share_event(full_event)
+        else:
+            controller.handle_message_event(full_event)
+
+
+@queue.task
+def deferred_event(event):
+    # An event the listener was too busy to handle, it has not been looked at yet so do it all here
+    event = json.loads(event)
+    _get_worker_controller(event.get('team'))._dispatch_event(event)
@@ -1,10 +1,5 @@
 import os
-import yaml
-import urllib
 import logging
-import urllib.error
-import urllib.request
-from slackclient import SlackClient
 
 logger = logging.getLogger(__name__)
 
@@ -12,30 +7,94 @@ logger = logging.getLogger(__name__)
 class Utils:
     """
     Shared functions
+
+    The config, slack client and lists are only loaded the first time they are used
     """
 
     def __init__(self):
-        self.CONFIG = yaml.load(open(os.environ['SB_CONFIG'], 'r'))
         self._cmd_path = os.environ['SB_CMD']
         if os.environ.get('SB_WORKER', 'true').lower() == 'false':
             self.is_worker = False
         else:
             self.is_worker = True
 
-        self.slack_client = SlackClient(self.CONFIG['SLACK_TOKEN'])
-        self.channels = self._get_channel_list()
-        self.groups = self._get_group_list()
-        self.channels.update(self.groups)  # Need this for private channels
-
-        self.users = self._get_user_list()
-        self.ims = self._get_im_list()
-
-        self.BOT_ID = self.users[self.CONFIG['BOT_NAME']]['id']
-        self.BOT_NAME = '<@{}>'.format(self.BOT_ID)
-
-        self.commands = self._load_commands()  # Needs to be after BOT_NAME is set
-
-        self.channel_to_actions = self.CONFIG['CHANNEL_TO_ACTIONS']
+        self._config = None
+        self._slack_client = None
+        self._channels = None
+        self._groups = None
+        self._users = None
+        self._ims = None
+        self._commands = None
+
+    @property
+    def CONFIG(self):  # noqa: N802
+        if self._config is None:
+            import yaml
+            with open(os.environ['SB_CONFIG'], 'r') as f:
+                self._config = yaml.safe_load(f)
+        return self._config
+
+    @property
+    def slack_client(self):
+        if self._slack_client is None:
+            from slackclient import SlackClient
+            self._slack_client = SlackClient(self.CONFIG['SLACK_TOKEN'])
+        return self._slack_client
+
+    @property
+    def channels(self):
+        if self._channels is None:
+            self._channels = self._get_channel_list()
+            self._channels.update(self.groups)  # Need this for private channels
+        return self._channels
+
+    @channels.setter
+    def channels(self, value):
+        self._channels = value
+
+    @property
+    def groups(self):
+        if self._groups is None:
+            self._groups = self._get_group_list()
+        return self._groups
+
+    @property
+    def users(self):
+        if self._users is None:
+            self._users = self._get_user_list()
+        return self._users
+
+    @users.setter
+    def users(self, value):
+        self._users = value
+
+    @property
+    def ims(self):
+        if self._ims is None:
+            self._ims = self._get_im_list()
+        return self._ims
+
+    @ims.setter
+    def ims(self, value):
+        self._ims = value
+
+    @property
+    def BOT_ID(self):  # noqa: N802
+        return self.users[self.CONFIG['BOT_NAME']]['id']
+
+    @property
+    def BOT_NAME(self):  # noqa: N802
+        return '<@{}>'.format(self.BOT_ID)
+
+    @property
+    def commands(self):
+        if self._commands is None:
+            self._commands = self._load_commands()  # Needs to be after BOT_NAME is set
+        return self._commands
+
+    @property
+    def channel_to_actions(self):
+        return self.CONFIG['CHANNEL_TO_ACTIONS']
 
     ###
     # Slack Functions
@@ -86,6 +145,9 @@ class Utils:
 
         base_dir = 'tmp_downloads'
 
+        import urllib.error
+        import urllib.request
+
         try:
             request = urllib.request.Request(url)
             request.add_header('Authorization', 'Bearer {}'.format(self.CONFIG['SLACK_TOKEN']))